@@ -36,6 +36,7 @@ generator = TextToImage(
     device_id=params.device_id,
     torch_dtype=params.torch_dtype,
     enable_attention_slicing=params.enable_attention_slicing,
+    memory_format=params.memory_format,
 )
 
 if params.clear_folder:
@@ -0,0 +1,30 @@
+import logging
+
+import torch
+
+
+def resolve_device(device_id):
+    """Resolve a device id to a torch.device
+
+    :param device_id: PyTorch device id, e.g "cuda:0". If `None`, the
+        default CUDA device will be used if available; otherwise the
+        CPU will be used
+    :type device_id: str | None
+
+    :return: Resolved device
+    :rtype: torch.device
+    """
+    if device_id is not None:
+        logging.info("Using device: %s", device_id)
+        return torch.device(device_id)
+
+    # Auto-select the device
+    if torch.cuda.is_available():
+        device = torch.device("cuda")
+        device_name = torch.cuda.get_device_name(device)
+        logging.info("CUDA enabled. Device: %s", device_name)
+    else:
+        logging.warning("No CUDA device is available. Using the CPU")
+        device = torch.device("cpu")
+
+    return device
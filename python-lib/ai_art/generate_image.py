@@ -1,10 +1,13 @@
 import abc
 import logging
 import math
+import os
 
 import torch
 from diffusers import StableDiffusionImg2ImgPipeline, StableDiffusionPipeline
 
+from ai_art.device import resolve_device
+
 
 class _BaseImageGenerator(abc.ABC):
     """Abstract base class used by the image-generator classes"""
@@ -18,6 +21,7 @@ class _BaseImageGenerator(abc.ABC):
         device_id=None,
         torch_dtype=None,
         enable_attention_slicing=False,
+        memory_format=None,
     ):
         """
         :param weights_path: Path to a local folder that contains the
@@ -35,10 +39,14 @@ class _BaseImageGenerator(abc.ABC):
         :param enable_attention_slicing: Enable sliced attention
             computation when generating the images
         :type enable_attention_slicing: bool
+        :param memory_format: Convert the pipeline's UNet to this
+            memory format, e.g. `torch.channels_last`. This has no
+            effect if running on the CPU
+        :type memory_format: torch.memory_format | None
 
         :return: None
         """
-        self._init_device(device_id)
+        self._device = resolve_device(device_id)
 
         # Running the pipeline will fail if half precison is enabled
         # when using the CPU
@@ -50,35 +58,24 @@ class _BaseImageGenerator(abc.ABC):
                 )
             torch_dtype = torch.float32
 
+        # Normalize the path to a str once, up front. Diffusers
+        # references many files under the weights folder, and a plain
+        # str avoids it re-handling a pathlib.Path for each of them
+        weights_path = os.fspath(weights_path)
+
         logging.info("Loading weights")
         self._init_pipe(weights_path, torch_dtype)
 
+        if memory_format is not None and self._device.type == "cuda":
+            # One-time layout conversion that's amortized across every
+            # inference step. NHWC (channels_last) matches cuDNN's
+            # preferred Tensor Core layout for the conv-heavy UNet
+            logging.info("Converting the UNet to %r", memory_format)
+            self._pipe.unet.to(memory_format=memory_format)
+
         if enable_attention_slicing:
             self._pipe.enable_attention_slicing()
 
-    def _init_device(self, device_id):
-        """Load the PyTorch device
-
-        :param device_id: PyTorch device id, e.g "cuda:0". If `None`,
-            the default CUDA device will be used if available; otherwise
-            the CPU will be used
-        :type device_id: str | None
-
-        :return: None
-        """
-        if device_id is None:
-            # Auto-select the device
-            if torch.cuda.is_available():
-                self._device = torch.device("cuda")
-                device_name = torch.cuda.get_device_name(self._device)
-                logging.info("CUDA enabled. Device: %s", device_name)
-            else:
-                logging.warning("No CUDA device is available. Using the CPU")
-                self._device = torch.device("cpu")
-        else:
-            logging.info("Using device: %s", device_id)
-            self._device = torch.device(device_id)
-
     @abc.abstractmethod
     def _init_pipe(self, weights_path, torch_dtype):
         """Load the pipeline from the pretrained weights
@@ -205,6 +202,10 @@ class _BaseImageGenerator(abc.ABC):
 class TextToImage(_BaseImageGenerator):
     """Generate images from a text prompt"""
 
+    # Declare empty slots so that instances don't allocate a `__dict__`,
+    # which would defeat the slots declared by the base class
+    __slots__ = ()
+
     def _init_pipe(self, weights_path, torch_dtype):
         pipe = StableDiffusionPipeline.from_pretrained(
             weights_path, torch_dtype=torch_dtype
@@ -273,6 +274,8 @@ class TextToImage(_BaseImageGenerator):
 class TextGuidedImageToImage(_BaseImageGenerator):
     """Generate images from a base image, guided by a text prompt"""
 
+    __slots__ = ()
+
     def _init_pipe(self, weights_path, torch_dtype):
         pipe = StableDiffusionImg2ImgPipeline.from_pretrained(
             weights_path, torch_dtype=torch_dtype
@@ -1,17 +1,157 @@
-import enum
+import hashlib
+import io
 import logging
 
+import numpy
+import PIL
 from PIL import Image
 
+# Pillow-SIMD reports its version with a ".post" suffix, e.g.
+# "9.0.0.post1". Log which backend is in use since the SIMD build is
+# only pinned in the code-env spec, and a plain Pillow install is a
+# silent performance regression
+if ".post" in PIL.__version__:
+    logging.info("Pillow-SIMD %s detected", PIL.__version__)
+else:
+    logging.info(
+        "Stock Pillow %s detected. Image resizing will be slower than with "
+        "Pillow-SIMD",
+        PIL.__version__,
+    )
+
+
+_READ_BUFFER_SIZE = 1 << 20
+"""Buffer size (in bytes) used when decoding from a download stream
+
+A large buffer amortizes the network round-trips into 1 MB reads
+instead of tiny socket-sized ones
+"""
+
+
+def _as_image_file(stream):
+    """Adapt a download stream so that Pillow can decode from it
+
+    Pillow requires a seekable file. Seekable raw streams are wrapped
+    in a large read buffer so that the decoder performs few, large
+    reads. Non-seekable streams are drained into memory, since there's
+    no way to decode them directly
+
+    :param stream: Download stream returned by
+        `dataiku.Folder.get_download_stream()`
+    :type stream: io.IOBase
+
+    :return: File-like object that Pillow can decode from
+    :rtype: io.IOBase
+    """
+    if isinstance(stream, io.RawIOBase) and stream.seekable():
+        return io.BufferedReader(stream, buffer_size=_READ_BUFFER_SIZE)
+
+    if stream.seekable():
+        # The stream is already buffered (or in memory)
+        return stream
+
+    return io.BytesIO(stream.read())
+
+
+_CACHE_DIR = "/.ai_art_cache"
+"""Folder subdirectory that holds cached resized base images
+
+The directory can be deleted at any time to purge the cache
+"""
+
+
+def _resized_cache_path(folder, image_path, resize_to):
+    """Compute the cache path for a resized base image
+
+    The source image's last-modified time is part of the cache key, so
+    replacing the image at the same path invalidates the old entry
+    instead of silently serving the stale pixels
+
+    :param folder: Folder that contains the original image
+    :type folder: dataiku.Folder
+    :param image_path: Filepath of the original image within the folder
+    :type image_path: str
+    :param resize_to: Size that the image is resized to
+    :type resize_to: int
+
+    :return: Path of the cached PNG within the folder, or `None` if the
+        image's details can't be read, in which case the cache can't be
+        safely used
+    :rtype: str | None
+    """
+    try:
+        details = folder.get_path_details(image_path)
+        last_modified = details["lastModified"]
+    except Exception:
+        logging.warning(
+            "Unable to get the details of %r. The base-image cache won't "
+            "be used",
+            image_path,
+            exc_info=True,
+        )
+        return None
 
-class _Dimension(enum.IntEnum):
-    """Enum that corresponds to the dimension's index in `Image.size`"""
+    key = f"{image_path}:{last_modified}:{resize_to}".encode("utf-8")
+    digest = hashlib.blake2b(key, digest_size=8).hexdigest()
+    return f"{_CACHE_DIR}/{digest}-{resize_to}.png"
 
-    WIDTH = 0
-    HEIGHT = 1
 
+def _read_cached_image(folder, cache_path):
+    """Read a previously cached resized image from the folder
 
-def open_base_image(folder, image_path, resize_to):
+    :param folder: Folder that holds the cache
+    :type folder: dataiku.Folder
+    :param cache_path: Path of the cached PNG within the folder
+    :type cache_path: str
+
+    :return: Cached image, or `None` if there's no usable cache entry
+    :rtype: PIL.Image.Image | None
+    """
+    try:
+        with folder.get_download_stream(cache_path) as stream:
+            file = _as_image_file(stream)
+            image = Image.open(file)
+            image.load()
+    except Exception:
+        logging.info("No cached base image at %r", cache_path)
+        return None
+
+    logging.info("Using cached base image: %r", cache_path)
+    return image
+
+
+def _write_cached_image(folder, cache_path, image):
+    """Cache a resized image in the folder
+
+    Failures are logged and ignored, since the cache is best-effort
+    (e.g. the folder may be read-only)
+
+    :param folder: Folder that holds the cache
+    :type folder: dataiku.Folder
+    :param cache_path: Path of the cached PNG within the folder
+    :type cache_path: str
+    :param image: Resized image to cache
+    :type image: PIL.Image.Image
+
+    :return: None
+    """
+    file = io.BytesIO()
+    image.save(file, format="PNG")
+    file.seek(0)
+
+    try:
+        folder.upload_stream(cache_path, file)
+    except Exception:
+        logging.warning(
+            "Unable to cache the resized base image", exc_info=True
+        )
+    else:
+        logging.info("Cached resized base image: %r", cache_path)
+
+
+def open_base_image(
+    folder, image_path, resize_to, device=None, use_cache=False
+):
     """Open image from a Dataiku folder to use with Stable Diffusion
 
     :param folder: Folder that contains the image
@@ -21,24 +161,118 @@ def open_base_image(folder, image_path, resize_to):
     :param resize_to: Resize the image to the given size. If `None`,
         don't resize the image
     :type resize_to: int | None
+    :param device: Torch device to resize the image on. If it's a CUDA
+        device, the resize runs on the GPU, and a preprocessed image
+        tensor is returned instead of a PIL image. Otherwise the resize
+        runs on the CPU via Pillow
+    :type device: torch.device | None
+    :param use_cache: Cache the resized image in `folder` so that later
+        runs with the same image and size skip the download, decode,
+        and resize. Only used when `resize_to` is set and the resize
+        runs on the CPU
+    :type use_cache: bool
 
     :return: Image that was opened
-    :rtype: PIL.Image.Image
+    :rtype: PIL.Image.Image | torch.Tensor
     """
-    with folder.get_download_stream(image_path) as file:
+    resize_on_gpu = device is not None and device.type == "cuda"
+
+    # The GPU resize is cheap and returns a device tensor, which can't
+    # be cached as a PNG, so the cache only covers the CPU path
+    use_cache = use_cache and resize_to is not None and not resize_on_gpu
+
+    if use_cache:
+        cache_path = _resized_cache_path(folder, image_path, resize_to)
+        if cache_path is None:
+            use_cache = False
+        else:
+            cached_image = _read_cached_image(folder, cache_path)
+            if cached_image is not None:
+                return cached_image
+
+    with folder.get_download_stream(image_path) as stream:
+        file = _as_image_file(stream)
         image = Image.open(file)
 
+        if resize_to is not None:
+            # Ask the decoder to downscale the image while decoding it.
+            # For JPEGs, libjpeg performs the downscaling in the DCT
+            # domain, which shrinks the decoded buffer before the
+            # Lanczos pass. The hint is twice the target size so that
+            # the final resize still has enough pixels to work with.
+            # This is a no-op for formats that don't support drafting,
+            # such as PNG
+            image.draft("RGB", (resize_to * 2, resize_to * 2))
+
+        # Force the decode while the stream is still open
+        image.load()
+
     # Convert the image to RGB per the Diffusers documentation
     # https://huggingface.co/docs/diffusers/v0.6.0/using-diffusers/img2img
-    if image.mode != "RGB":
-        image = image.convert("RGB")
+    image = _convert_to_rgb(image)
 
     if resize_to is not None:
-        image = _resize_image(image, min_size=resize_to)
+        if resize_on_gpu:
+            image = _resize_image_torch(
+                image, min_size=resize_to, device=device
+            )
+        else:
+            image = _resize_image(image, min_size=resize_to)
+
+            if use_cache:
+                _write_cached_image(folder, cache_path, image)
 
     return image
 
 
+def _convert_to_rgb(image):
+    """Convert an image to RGB mode
+
+    The common RGBA case is handled with a NumPy slice, which skips
+    Pillow's scalar per-channel conversion pass. Other modes fall back
+    to `Image.convert()`
+
+    :param image: Image to convert
+    :type image: PIL.Image.Image
+
+    :return: Image in RGB mode. If the image is already RGB, it's
+        returned unchanged
+    :rtype: PIL.Image.Image
+    """
+    if image.mode == "RGB":
+        return image
+
+    if image.mode == "RGBA":
+        # `Image.convert("RGB")` simply drops the alpha channel for
+        # RGBA images, so slicing off the fourth channel is equivalent
+        array = numpy.asarray(image)
+        return Image.fromarray(array[..., :3], "RGB")
+
+    return image.convert("RGB")
+
+
+def _get_resized_size(size, min_size):
+    """Compute the size that an image will be resized to
+
+    :param size: Current size of the image, as `(width, height)`
+    :type size: tuple[int, int]
+    :param min_size: The size that you want the shorter dimension of the
+        image to be resized to
+    :type min_size: int
+
+    The aspect ratio of the image is maintained
+
+    :return: New size of the image, as `(width, height)`
+    :rtype: tuple[int, int]
+    """
+    width, height = size
+    scale = min_size / min(size)
+
+    # The shorter dimension scales to exactly `min_size`; only the
+    # larger dimension is actually rounded
+    return (round(width * scale), round(height * scale))
+
+
 def _resize_image(image, min_size):
     """Resize the image so that the shorter dimension equals `min_size`
 
@@ -50,37 +284,91 @@ def _resize_image(image, min_size):
 
     The aspect ratio of the image is maintained
 
-    :return: Resized image
+    :return: Resized image. If the image is already the right size, the
+        original image is returned unchanged, so callers that mutate
+        the result must copy it themselves
     :rtype: PIL.Image.Image
     """
-    # `base_dimension` is the shorter dimension that will be resized to
-    # `min_size`
-    if image.width < image.height:
-        base_dimension = _Dimension.WIDTH
-        larger_dimension = _Dimension.HEIGHT
-    else:
-        base_dimension = _Dimension.HEIGHT
-        larger_dimension = _Dimension.WIDTH
+    new_size = _get_resized_size(image.size, min_size)
 
-    current_base_size = image.size[base_dimension]
-    current_larger_size = image.size[larger_dimension]
+    if new_size == image.size:
+        # Return the original image if it's already the right size.
+        # Copying it would allocate and fill a full pixel buffer
+        # (~12 MB for a 2048x2048 RGB image) for nothing
+        return image
 
-    if current_base_size == min_size:
-        # Return an unchanged copy of the image if it's already the
-        # right size.
-        # A copy is returned so that it matches the behavior of
-        # `Image.resize()`, which also creates a copy
-        return image.copy()
+    logging.info("Resizing base image from %r to %r", image.size, new_size)
 
-    resized_larger_size = round(
-        current_larger_size / current_base_size * min_size
-    )
+    # Handle the integer part of the downscale with `Image.reduce()`,
+    # which is a box filter that's much cheaper than the Lanczos
+    # convolution. The Lanczos pass below then only covers the
+    # remaining non-integer factor
+    reduce_factor = min(image.size) // min_size
+    if reduce_factor >= 2:
+        image = image.reduce(reduce_factor)
 
-    if base_dimension is _Dimension.WIDTH:
-        new_size = (min_size, resized_larger_size)
-    else:
-        new_size = (resized_larger_size, min_size)
+        if image.size == new_size:
+            # The downscale was an exact integer factor, so the box
+            # reduction did all of the work
+            return image
 
-    logging.info("Resizing base image from %r to %r", image.size, new_size)
-    resized_image = image.resize(new_size, resample=Image.Resampling.LANCZOS)
+    # `reducing_gap` enables Pillow's two-pass resize: a cheap box
+    # reduction followed by the Lanczos convolution. It's much faster
+    # for large downscales with negligible quality loss
+    resized_image = image.resize(
+        new_size, resample=Image.Resampling.LANCZOS, reducing_gap=2.0
+    )
     return resized_image
+
+
+def _resize_image_torch(image, min_size, device):
+    """Resize the image on a Torch device
+
+    :param image: Image to resize
+    :type image: PIL.Image.Image
+    :param min_size: The size that you want the shorter dimension of the
+        image to be resized to
+    :type min_size: int
+    :param device: Torch device that the resize will run on. The
+        returned tensor is left on this device so that the pipeline
+        doesn't need to copy it again
+    :type device: torch.device
+
+    The aspect ratio of the image is maintained
+
+    :return: Resized image as a preprocessed tensor in the format
+        expected by `StableDiffusionImg2ImgPipeline`: float32, NCHW,
+        scaled to the range [-1, 1]
+    :rtype: torch.Tensor
+    """
+    # Imported lazily so that image.py can be used without Torch, e.g.
+    # by the unit tests that only exercise the Pillow path
+    import torch
+    import torch.nn.functional
+
+    new_size = _get_resized_size(image.size, min_size)
+
+    tensor = torch.from_numpy(numpy.asarray(image))
+    tensor = tensor.to(device, non_blocking=True)
+    tensor = tensor.permute(2, 0, 1).unsqueeze(0).float()
+
+    if new_size != image.size:
+        logging.info(
+            "Resizing base image from %r to %r on device %r",
+            image.size,
+            new_size,
+            device,
+        )
+        # `interpolate()` takes the size as (height, width), the
+        # reverse of PIL
+        tensor = torch.nn.functional.interpolate(
+            tensor,
+            size=(new_size[1], new_size[0]),
+            mode="bicubic",
+            antialias=True,
+        )
+
+    # Scale the pixel values from [0, 255] to [-1, 1], matching the
+    # preprocessing that the pipeline applies to PIL images
+    tensor = tensor.div_(127.5).sub_(1.0).clamp_(-1.0, 1.0)
+    return tensor
@@ -1,14 +1,30 @@
+import concurrent.futures
 import logging
 from urllib.parse import urljoin
 
-import dataiku
-import torch
-
 from dku_config import DkuConfig
+from dku_config.dss_parameter import DSSParameterError
 from ai_art.constants import HUGGING_FACE_BASE_URL
 from ai_art.folder import get_file_path_or_temp
 from ai_art.image import open_base_image
 
+_MODEL_REPO_BASE_URL = (
+    HUGGING_FACE_BASE_URL
+    if HUGGING_FACE_BASE_URL.endswith("/")
+    else HUGGING_FACE_BASE_URL + "/"
+)
+"""Base URL with a trailing slash, precomputed for `_cast_model_repo()`"""
+
+_DEFAULT_RESIZE_BASE_IMAGE = True
+"""Default value of the `resize_base_image` param"""
+
+_DEFAULT_RESIZE_BASE_IMAGE_TO = 512
+"""Default value of the `resize_base_image_to` param
+
+This is shared by the param spec and by `_load_base_image()`, which
+reads the raw recipe config before the params are built
+"""
+
 
 def _cast_model_repo(model_repo_path):
     """Resolve the model_repo param to an absolute URL
@@ -19,6 +35,14 @@ def _cast_model_repo(model_repo_path):
     :return: Absolute URL of the model repo
     :rtype: str
     """
+    if "://" not in model_repo_path and not model_repo_path.startswith("/"):
+        # Common case: a plain "user/model" path. Concatenating gives
+        # the same result as `urljoin()` without re-parsing the base
+        # URL on every call
+        return _MODEL_REPO_BASE_URL + model_repo_path
+
+    # Absolute URLs and absolute paths need urljoin's full resolution
+    # rules
     model_repo = urljoin(HUGGING_FACE_BASE_URL, model_repo_path)
     return model_repo
 
@@ -51,12 +75,42 @@ def _cast_torch_dtype(use_half_precision):
         torch.dtype of the model (float32)
     :rtype: torch.dtype | None
     """
+    # Torch is imported lazily because importing it is slow (up to
+    # multiple seconds), and params.py is also imported in contexts
+    # that never touch Torch, e.g. the model-revisions macro
+    import torch
+
     if use_half_precision:
         return torch.float16
     else:
         return None
 
 
+def _cast_memory_format(use_half_precision):
+    """Get the `memory_format` param based on `use_half_precision`
+
+    NHWC (`channels_last`) layout speeds up the conv-heavy UNet on
+    recent CUDA devices because it matches cuDNN's preferred Tensor
+    Core layout. It pairs best with half precision, so it's keyed off
+    the same recipe param
+
+    :param use_half_precision: Whether or not to use half-precison
+        (16-bit) floats
+    :type use_half_precision: bool
+
+    :return: torch.memory_format that the pipeline's UNet will use, or
+        `None` to keep the default contiguous (NCHW) format
+    :rtype: torch.memory_format | None
+    """
+    # Imported lazily; see `_cast_torch_dtype()`
+    import torch
+
+    if use_half_precision:
+        return torch.channels_last
+    else:
+        return None
+
+
 def _cast_random_seed(random_seed):
     """Cast the `random_seed` param to an int, or set it to `None`
 
@@ -78,6 +132,146 @@ def _cast_random_seed(random_seed):
         return None
 
 
+def _load_base_image(recipe_config, base_image_folder):
+    """Load the base image that's specified by the recipe config
+
+    This reads the raw values from `recipe_config` rather than a
+    DkuConfig so that it can run in a background thread while the rest
+    of the config is built and validated. The values are validated
+    separately when the corresponding params are added to the config
+
+    :param recipe_config: Recipe config
+    :type recipe_config: Mapping[str, Any]
+    :param base_image_folder: Input base_image_folder
+    :type base_image_folder: dataiku.Folder
+
+    :return: Image that was opened
+    :rtype: PIL.Image.Image | torch.Tensor
+    """
+    base_image_path = recipe_config.get("base_image_path")
+
+    resize_base_image = recipe_config.get("resize_base_image")
+    if resize_base_image is None:
+        resize_base_image = _DEFAULT_RESIZE_BASE_IMAGE
+
+    if resize_base_image:
+        resize_to = int(
+            recipe_config.get("resize_base_image_to")
+            or _DEFAULT_RESIZE_BASE_IMAGE_TO
+        )
+        # Imported lazily; see `_cast_torch_dtype()`
+        from ai_art.device import resolve_device
+
+        # Resize the image on the device that the pipeline will run on.
+        # When it's a CUDA device, this avoids a CPU Lanczos pass, and
+        # the resized tensor is already on-device for the pipeline
+        device = resolve_device(_cast_device_id(recipe_config.get("device")))
+    else:
+        resize_to = None
+        device = None
+
+    logging.info("Opening base image: %r", base_image_path)
+    return open_base_image(
+        folder=base_image_folder,
+        image_path=base_image_path,
+        resize_to=resize_to,
+        device=device,
+        use_cache=True,
+    )
+
+
+_BASE_RECIPE_PARAM_SPECS = (
+    {
+        "name": "prompt",
+        "label": "Prompt",
+        "required": True,
+    },
+    {
+        "name": "image_count",
+        "label": "Image count",
+        "default": 1,
+        "cast_to": int,
+        "checks": ({"type": "sup_eq", "op": 1},),
+    },
+    {
+        "name": "batch_size",
+        "label": "Batch size",
+        "default": 1,
+        "cast_to": int,
+        "checks": ({"type": "sup_eq", "op": 1},),
+    },
+    {
+        "name": "filename_prefix",
+        "label": "Filename prefix",
+        "default": "image-",
+    },
+    {
+        "name": "device_id",
+        "label": "CUDA device",
+        "config_key": "device",
+        "required": False,
+        "cast_to": _cast_device_id,
+    },
+    {
+        "name": "clear_folder",
+        "label": "Clear folder",
+        "default": True,
+    },
+    {
+        "name": "use_autocast",
+        "label": "CUDA autocast",
+        "default": True,
+    },
+    {
+        "name": "torch_dtype",
+        "label": "Half precision",
+        "config_key": "use_half_precision",
+        "default": True,
+        "cast_to": _cast_torch_dtype,
+    },
+    {
+        "name": "memory_format",
+        "label": "Half precision",
+        "config_key": "use_half_precision",
+        "default": True,
+        "cast_to": _cast_memory_format,
+    },
+    {
+        "name": "enable_attention_slicing",
+        "label": "Attention slicing",
+        "default": True,
+    },
+    {
+        "name": "random_seed",
+        "label": "Random seed",
+        "required": False,
+        "cast_to": _cast_random_seed,
+    },
+    {
+        "name": "num_inference_steps",
+        "label": "Denoising steps",
+        "default": 50,
+        "cast_to": int,
+        "checks": ({"type": "sup_eq", "op": 1},),
+    },
+    {
+        "name": "guidance_scale",
+        "label": "Guidance scale",
+        "default": 7.5,
+        "cast_to": float,
+        "checks": ({"type": "sup_eq", "op": 0.0},),
+    },
+)
+"""Declarative specs for the recipe params shared by both recipes
+
+Each spec holds the kwargs that are passed to `DkuConfig.add_param()`.
+The optional "config_key" entry is the key that the param's value is
+read from in the recipe config; it defaults to the param's name. The
+specs are built once at import instead of being re-created inside
+`_get_base_config()` on every call
+"""
+
+
 def _get_base_config(recipe_config, weights_folder, image_folder):
     """Create a DkuConfig instance that contains shared recipe params
 
@@ -116,109 +310,20 @@ def _get_base_config(recipe_config, weights_folder, image_folder):
         required=True,
     )
 
-    config.add_param(
-        name="prompt",
-        label="Prompt",
-        value=recipe_config.get("prompt"),
-        required=True,
-    )
-    config.add_param(
-        name="image_count",
-        label="Image count",
-        value=recipe_config.get("image_count"),
-        default=1,
-        cast_to=int,
-        checks=(
-            {
-                "type": "sup_eq",
-                "op": 1,
-            },
-        ),
-    )
-    config.add_param(
-        name="batch_size",
-        label="Batch size",
-        value=recipe_config.get("batch_size"),
-        default=1,
-        cast_to=int,
-        checks=(
-            {
-                "type": "sup_eq",
-                "op": 1,
-            },
-        ),
-    )
-    config.add_param(
-        name="filename_prefix",
-        label="Filename prefix",
-        value=recipe_config.get("filename_prefix"),
-        default="image-",
-    )
-    config.add_param(
-        name="device_id",
-        label="CUDA device",
-        value=recipe_config.get("device"),
-        required=False,
-        cast_to=_cast_device_id,
-    )
-    config.add_param(
-        name="clear_folder",
-        label="Clear folder",
-        value=recipe_config.get("clear_folder"),
-        default=True,
-    )
-    config.add_param(
-        name="use_autocast",
-        label="CUDA autocast",
-        value=recipe_config.get("use_autocast"),
-        default=True,
-    )
-    config.add_param(
-        name="torch_dtype",
-        label="Half precision",
-        value=recipe_config.get("use_half_precision"),
-        default=True,
-        cast_to=_cast_torch_dtype,
-    )
-    config.add_param(
-        name="enable_attention_slicing",
-        label="Attention slicing",
-        value=recipe_config.get("enable_attention_slicing"),
-        default=True,
-    )
-    config.add_param(
-        name="random_seed",
-        label="Random seed",
-        value=recipe_config.get("random_seed"),
-        required=False,
-        cast_to=_cast_random_seed,
-    )
-    config.add_param(
-        name="num_inference_steps",
-        label="Denoising steps",
-        value=recipe_config.get("num_inference_steps"),
-        default=50,
-        cast_to=int,
-        checks=(
-            {
-                "type": "sup_eq",
-                "op": 1,
-            },
-        ),
-    )
-    config.add_param(
-        name="guidance_scale",
-        label="Guidance scale",
-        value=recipe_config.get("guidance_scale"),
-        default=7.5,
-        cast_to=float,
-        checks=(
-            {
-                "type": "sup_eq",
-                "op": 0.0,
-            },
-        ),
-    )
+    # Validate every param before failing, so that the user sees all of
+    # the config errors at once instead of fixing them one run at a
+    # time
+    errors = []
+    for spec in _BASE_RECIPE_PARAM_SPECS:
+        spec = dict(spec)
+        config_key = spec.pop("config_key", spec["name"])
+        try:
+            config.add_param(value=recipe_config.get(config_key), **spec)
+        except DSSParameterError as e:
+            errors.append(str(e))
+
+    if errors:
+        raise DSSParameterError("\n".join(errors))
 
     return config
 
@@ -304,60 +409,61 @@ def get_text_guided_image_to_image_config(
     :return: Created DkuConfig instance
     :rtype: dku_config.DkuConfig
     """
-    config = _get_base_config(recipe_config, weights_folder, image_folder)
-
     logging.info("Base image folder: %r", base_image_folder.name)
 
-    config.add_param(
-        name="base_image_path",
-        label="Base image",
-        value=recipe_config.get("base_image_path"),
-        required=True,
-    )
-    config.add_param(
-        name="resize_base_image",
-        label="Resize images",
-        value=recipe_config.get("resize_base_image"),
-        default=True,
-    )
-    config.add_param(
-        name="resize_base_image_to",
-        label="Image size",
-        value=recipe_config.get("resize_base_image_to"),
-        default=512,
-        cast_to=int,
-        checks=(
-            {
-                "type": "in",
-                "op": frozenset((512, 768)),
-            },
-        ),
-    )
-    config.add_param(
-        name="strength",
-        label="Strength",
-        value=recipe_config.get("strength"),
-        default=0.8,
-        cast_to=float,
-        checks=(
-            {
-                "type": "between",
-                "op": (0.0, 1.0),
-            },
-        ),
-    )
+    # Load the base image in a background thread so that the download,
+    # decode, and resize overlap with the weights-path resolution done
+    # by `_get_base_config()`. The download stream and Pillow release
+    # the GIL during the heavy work, so both tasks genuinely run in
+    # parallel
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        base_image_future = executor.submit(
+            _load_base_image, recipe_config, base_image_folder
+        )
 
-    if config.resize_base_image:
-        resize_to = config.resize_base_image_to
-    else:
-        resize_to = None
+        config = _get_base_config(recipe_config, weights_folder, image_folder)
+
+        config.add_param(
+            name="base_image_path",
+            label="Base image",
+            value=recipe_config.get("base_image_path"),
+            required=True,
+        )
+        config.add_param(
+            name="resize_base_image",
+            label="Resize images",
+            value=recipe_config.get("resize_base_image"),
+            default=_DEFAULT_RESIZE_BASE_IMAGE,
+        )
+        config.add_param(
+            name="resize_base_image_to",
+            label="Image size",
+            value=recipe_config.get("resize_base_image_to"),
+            default=_DEFAULT_RESIZE_BASE_IMAGE_TO,
+            cast_to=int,
+            checks=(
+                {
+                    "type": "in",
+                    "op": frozenset((512, 768)),
+                },
+            ),
+        )
+        config.add_param(
+            name="strength",
+            label="Strength",
+            value=recipe_config.get("strength"),
+            default=0.8,
+            cast_to=float,
+            checks=(
+                {
+                    "type": "between",
+                    "op": (0.0, 1.0),
+                },
+            ),
+        )
+
+        base_image = base_image_future.result()
 
-    logging.info("Opening base image: %r", config.base_image_path)
-    base_image = open_base_image(
-        folder=base_image_folder,
-        image_path=config.base_image_path,
-        resize_to=resize_to,
-    )
     config.add_param(name="base_image", value=base_image, required=True)
 
     return config
@@ -406,6 +512,10 @@ def get_download_weights_config(macro_config):
     :return: Created DkuConfig instance
     :rtype: dku_config.DkuConfig
     """
+    # Imported lazily so that importing params.py stays cheap outside
+    # of DSS; see `_cast_torch_dtype()`
+    import dataiku
+
     config = DkuConfig()
 
     add_model_repo(config, macro_config)
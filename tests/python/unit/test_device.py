@@ -0,0 +1,22 @@
+import torch
+
+from ai_art.device import resolve_device
+
+
+class TestResolveDevice:
+    def test_explicit_device(self):
+        device = resolve_device("cpu")
+        assert device == torch.device("cpu")
+
+    def test_auto_with_cuda(self, mocker):
+        mocker.patch("torch.cuda.is_available", return_value=True)
+        mocker.patch("torch.cuda.get_device_name", return_value="FAKE GPU")
+
+        device = resolve_device(None)
+        assert device == torch.device("cuda")
+
+    def test_auto_without_cuda(self, mocker):
+        mocker.patch("torch.cuda.is_available", return_value=False)
+
+        device = resolve_device(None)
+        assert device == torch.device("cpu")
@@ -1,6 +1,139 @@
+import io
+
+import torch
 from PIL import Image
 
-from ai_art.image import _resize_image
+from ai_art.image import (
+    _resize_image,
+    _resize_image_torch,
+    _resized_cache_path,
+    open_base_image,
+)
+
+
+class TestOpenBaseImage:
+    @staticmethod
+    def _create_folder(mocker, image, image_format):
+        """Create a mock folder that serves the given image
+
+        The image is encoded in the given format and returned by the
+        folder's `get_download_stream()` method
+        """
+        file = io.BytesIO()
+        image.save(file, format=image_format)
+        file.seek(0)
+
+        folder = mocker.MagicMock()
+        stream_context = folder.get_download_stream.return_value
+        stream_context.__enter__.return_value = file
+        folder.get_path_details.return_value = {"lastModified": 1000}
+        return folder
+
+    def test_jpeg_resize(self, mocker):
+        base_image = Image.new("RGB", (2048, 1024))
+        folder = self._create_folder(mocker, base_image, "JPEG")
+
+        image = open_base_image(folder, "image.jpg", resize_to=512)
+
+        assert image.size == (1024, 512)
+        assert image.mode == "RGB"
+
+    def test_png_no_resize(self, mocker):
+        base_image = Image.new("RGB", (600, 400))
+        folder = self._create_folder(mocker, base_image, "PNG")
+
+        image = open_base_image(folder, "image.png", resize_to=None)
+
+        assert image.size == (600, 400)
+
+    def test_rgba_converted_to_rgb(self, mocker):
+        base_image = Image.new("RGBA", (1024, 1024), color=(10, 20, 30, 40))
+        folder = self._create_folder(mocker, base_image, "PNG")
+
+        image = open_base_image(folder, "image.png", resize_to=512)
+
+        assert image.size == (512, 512)
+        assert image.mode == "RGB"
+        # The alpha channel is dropped without compositing, matching
+        # the behavior of `Image.convert("RGB")`
+        assert image.getpixel((0, 0)) == (10, 20, 30)
+
+    def test_palette_converted_to_rgb(self, mocker):
+        base_image = Image.new("P", (1024, 1024))
+        folder = self._create_folder(mocker, base_image, "PNG")
+
+        image = open_base_image(folder, "image.png", resize_to=512)
+
+        assert image.mode == "RGB"
+
+    def test_cache_miss(self, mocker):
+        """The resized image is cached when there's no cache entry"""
+        base_image = Image.new("RGB", (1024, 1024))
+        file = io.BytesIO()
+        base_image.save(file, format="PNG")
+        file.seek(0)
+
+        stream_context = mocker.MagicMock()
+        stream_context.__enter__.return_value = file
+
+        folder = mocker.MagicMock()
+        folder.get_path_details.return_value = {"lastModified": 1000}
+        # The first call is the cache read, which fails; the second
+        # call downloads the original image
+        folder.get_download_stream.side_effect = (
+            Exception("No such file"),
+            stream_context,
+        )
+
+        image = open_base_image(
+            folder, "image.png", resize_to=512, use_cache=True
+        )
+
+        assert image.size == (512, 512)
+        folder.upload_stream.assert_called_once()
+        cache_path = folder.upload_stream.call_args.args[0]
+        assert cache_path.startswith("/.ai_art_cache/")
+
+    def test_cache_hit(self, mocker):
+        """A cached image is used without downloading the original"""
+        cached_image = Image.new("RGB", (512, 512))
+        folder = self._create_folder(mocker, cached_image, "PNG")
+
+        image = open_base_image(
+            folder, "image.png", resize_to=512, use_cache=True
+        )
+
+        assert image.size == (512, 512)
+        folder.get_download_stream.assert_called_once()
+        folder.upload_stream.assert_not_called()
+
+    def test_cache_invalidated_by_modification(self, mocker):
+        """Replacing the source image changes the cache path"""
+        folder = mocker.MagicMock()
+
+        folder.get_path_details.return_value = {"lastModified": 1000}
+        old_cache_path = _resized_cache_path(folder, "image.png", 512)
+
+        folder.get_path_details.return_value = {"lastModified": 2000}
+        new_cache_path = _resized_cache_path(folder, "image.png", 512)
+
+        assert old_cache_path != new_cache_path
+
+    def test_cache_skipped_without_details(self, mocker):
+        """The cache isn't used when the image details can't be read"""
+        base_image = Image.new("RGB", (1024, 1024))
+        folder = self._create_folder(mocker, base_image, "PNG")
+        folder.get_path_details.side_effect = Exception("No such file")
+
+        image = open_base_image(
+            folder, "image.png", resize_to=512, use_cache=True
+        )
+
+        assert image.size == (512, 512)
+        # The only download is the original image; no cache read was
+        # attempted, and nothing was cached
+        folder.get_download_stream.assert_called_once_with("image.png")
+        folder.upload_stream.assert_not_called()
 
 
 class TestResizeImage:
@@ -15,8 +148,9 @@ class TestResizeImage:
         resized_image = _resize_image(base_image, min_size=512)
 
         assert resized_image.size == (512, 512)
-        # Assert that the new image is a copy of the original image
-        assert resized_image is not base_image
+        # Assert that the original image is returned unchanged instead
+        # of an unnecessary copy
+        assert resized_image is base_image
 
     def test_smaller_square(self):
         base_image = self._create_image(256, 256)
@@ -68,8 +202,59 @@ class TestResizeImage:
 
         assert resized_image.size == (540, 512)
 
+    def test_integer_factor(self):
+        """Downscales by an exact integer factor use the box reduction"""
+        base_image = self._create_image(2048, 1536)
+        resized_image = _resize_image(base_image, min_size=512)
+
+        assert resized_image.size == (683, 512)
+
     def test_different_min_size(self):
         base_image = self._create_image(512, 512)
         resized_image = _resize_image(base_image, min_size=256)
 
         assert resized_image.size == (256, 256)
+
+
+class TestResizeImageTorch:
+    """The Torch resize runs on the CPU device in these tests since no
+    CUDA device is available, but the codepath is the same
+    """
+
+    _DEVICE = torch.device("cpu")
+
+    @staticmethod
+    def _create_image(width, height):
+        """Create a new blank image of the given size"""
+        image = Image.new("RGB", (width, height))
+        return image
+
+    def test_resize(self):
+        base_image = self._create_image(1024, 2048)
+        tensor = _resize_image_torch(
+            base_image, min_size=512, device=self._DEVICE
+        )
+
+        # The tensor is NCHW, so the height comes before the width
+        assert tuple(tensor.shape) == (1, 3, 1024, 512)
+
+    def test_same_size(self):
+        base_image = self._create_image(512, 512)
+        tensor = _resize_image_torch(
+            base_image, min_size=512, device=self._DEVICE
+        )
+
+        assert tuple(tensor.shape) == (1, 3, 512, 512)
+
+    def test_value_range(self):
+        """Assert that the pixel values are scaled to [-1, 1]"""
+        base_image = Image.new("RGB", (1024, 1024), color=(255, 255, 255))
+        tensor = _resize_image_torch(
+            base_image, min_size=512, device=self._DEVICE
+        )
+
+        assert tensor.dtype == torch.float32
+        assert torch.all(tensor <= 1.0)
+        assert torch.all(tensor >= -1.0)
+        # A pure-white image should map to (approximately) all ones
+        assert torch.allclose(tensor, torch.ones_like(tensor), atol=1e-4)